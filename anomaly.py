@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+# Find intermittent low speeds in JSON logs from the client or the server
+
+import sys
+import collections
+import getopt
+import json
+import math
+
+class AnomalyDetector(object):
+    """
+    Flag tests with speeds well below the recent speeds of the same client.
+
+    Each input line is a one-level JSON dictionary as written by 'client.py'
+    to its log or by 'server.js' to stdout.  Only the download and upload
+    reports are used, because they carry the client's measurements; other
+    lines are skipped without being parsed.
+
+    Each client (external IP and test ID) has a baseline for each direction,
+    the exponentially weighted moving average (EWMA) and variance of its
+    speeds.  A test is an anomaly when its speed is less than 'fraction'
+    times the baseline average.  Every test updates the baseline, so a
+    lasting change of speed becomes the new baseline.  Memory use is
+    constant for each client, however long the input, and at most
+    'maxClients' clients are kept: the least recently seen client is
+    dropped when there are too many.
+    """
+
+    # defaults -- treat as class constants
+    defaultFraction = 0.5   # anomaly if speed < fraction * baseline
+    defaultAlpha = 0.1      # EWMA weight of newest speed
+    defaultWarmup = 5       # tests needed before baseline is used
+    defaultMaxClients = 100_000     # least recently seen are dropped
+
+    downreportPath = '/downreport'
+    upreportPath = '/upreport'
+
+    bitsPerDataByte = 8
+
+    # copied from the test record to an alert
+    alertInfo = (
+        "testID",
+        "externalIP",
+        "testNumber",
+        "pathname",
+        "clientTimestamp",
+        "serverTimestamp",
+    )
+
+    @classmethod
+    def speed(cls, value):
+        """
+        Megabits per second from a download or upload report.
+
+        Returns None for any other record, or if the speed can not be
+        calculated, such as when a length or time is missing or is not a
+        number.  Times are as used for the human-readable reports of
+        'client.py'.
+        """
+        pathname = value.get('pathname')
+        try:
+            if pathname == cls.downreportPath:
+                length = value['downloadReceiveLength']
+                milliseconds = (value['clientResponseEnd']
+                                    - value['clientResponseBegin'])
+            elif pathname == cls.upreportPath:
+                length = value['uploadReceiveLength']
+                milliseconds = (value['clientResponseEnd']
+                                    - value['clientRequestBegin'])
+            else:
+                return None
+        except (KeyError, TypeError):
+            return None
+        for number in (length, milliseconds):
+            if type(number) not in (int, float):    # bool is not a number
+                return None
+        if not (length > 0 and milliseconds > 0):
+            return None
+        return cls.bitsPerDataByte * length / milliseconds / 1_000
+
+    class Baseline(object):
+        """
+        EWMA and variance of the speeds in one direction for one client.
+        """
+        __slots__ = ('count', 'mean', 'variance', 'minimum', 'anomalies')
+
+        def __init__(self):
+            self.count = 0
+            self.mean = 0.0
+            self.variance = 0.0
+            self.minimum = None
+            self.anomalies = 0
+
+        def update(self, speed, alpha):
+            """
+            Add a speed, using the exponentially weighted form of Welford's
+            incremental mean and variance.
+            """
+            self.count += 1
+            if self.count == 1:
+                self.mean = speed
+            else:
+                diff = speed - self.mean
+                increment = alpha * diff
+                self.mean += increment
+                self.variance = (1 - alpha) * (self.variance + diff * increment)
+            if self.minimum is None or speed < self.minimum:
+                self.minimum = speed
+
+    def __init__(self,  fraction=defaultFraction,
+                        alpha=defaultAlpha,
+                        warmup=defaultWarmup,
+                        maxClients=defaultMaxClients):
+        """
+        Create a detector with no clients.
+
+        fraction    anomaly if speed is less than this fraction of baseline
+        alpha       weight of the newest speed in the baseline, 0 < alpha <= 1
+        warmup      number of tests in a baseline before it is used
+        maxClients  most clients kept, least recently seen are dropped
+        """
+        super().__init__()
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be more than 0 and at most 1')
+        if maxClients < 1:
+            raise ValueError('maxClients must be at least 1')
+        self._fraction = fraction
+        self._alpha = alpha
+        self._warmup = warmup
+        self._maxClients = maxClients
+        # (externalIP, testID) -> {'download': Baseline, 'upload': Baseline}
+        # in order of last test, least recently seen first
+        self._clients = collections.OrderedDict()
+        self._droppedClients = 0
+        self._lines = 0
+        self._invalidLines = 0      # not valid JSON, e.g. cut off
+        self._tests = 0
+        self._anomalies = 0
+
+    def process(self, value):
+        """
+        Add one test record, return an alert dictionary or None.
+
+        Values that are not dictionaries are skipped.
+        """
+        if not isinstance(value, dict):
+            return None
+        speed = self.speed(value)
+        if speed is None or value.get('error'):
+            return None
+        self._tests += 1
+        key = (value.get('externalIP'), value.get('testID'))
+        client = self._clients.get(key)
+        if client is None:
+            if len(self._clients) >= self._maxClients:
+                self._clients.popitem(last=False)   # least recently seen
+                self._droppedClients += 1
+            client = {'download': self.Baseline(), 'upload': self.Baseline()}
+            self._clients[key] = client
+        else:
+            self._clients.move_to_end(key)          # most recently seen
+        direction = ('download' if value['pathname'] == self.downreportPath
+                                else 'upload')
+        baseline = client[direction]
+
+        alert = None
+        if (baseline.count >= self._warmup
+                and speed < self._fraction * baseline.mean):
+            baseline.anomalies += 1
+            self._anomalies += 1
+            alert = collections.OrderedDict()
+            for name in self.alertInfo:
+                if name in value:
+                    alert.setdefault(name, value[name])
+            alert['direction'] = direction
+            alert['speed'] = round(speed, 3)
+            alert['baseline'] = round(baseline.mean, 3)
+            alert['stddev'] = round(math.sqrt(baseline.variance), 3)
+            alert['ratio'] = round(speed / baseline.mean, 3)
+            alert['anomalyNumber'] = baseline.anomalies
+        baseline.update(speed, self._alpha)
+        return alert
+
+    def processLine(self, line):
+        """
+        Add one line of JSON text, return an alert dictionary or None.
+
+        Lines that can not be a download or upload report are not parsed.
+        Lines that are not valid JSON, such as a line cut off at the end of
+        a log that is still being written, are counted and skipped.
+        """
+        self._lines += 1
+        if 'report"' not in line:   # fast reject, e.g. "/downreport"
+            return None
+        strippedLine = line.strip()
+        if strippedLine == '':
+            return None
+        try:
+            value = json.loads(strippedLine)
+        except ValueError:
+            self._invalidLines += 1
+            return None
+        return self.process(value)
+
+    def copy(self, lineReader, writer):
+        """
+        Read JSON lines to the end of input and write alerts as JSON lines.
+
+        lineReader is an iterable text source, such as an open file.
+        May be called more than once, baselines are kept between calls.
+        """
+        line_num = 0
+        try:
+            for line in lineReader:
+                line_num += 1
+                alert = self.processLine(line)
+                if alert is not None:
+                    writer.write(json.dumps(alert) + '\n')
+        except Exception as e:
+            # Error is most likely due to error in creating the input
+            raise RuntimeError('Error at line ' + str(line_num)
+                                + ' of input.') from e
+
+    def summary(self):
+        """
+        Iterate a summary dictionary for each client that is still kept,
+        least recently seen first.
+        """
+        for (externalIP, testID), client in self._clients.items():
+            value = collections.OrderedDict((
+                    ('externalIP', externalIP),
+                    ('testID', testID),
+            ))
+            for direction, baseline in client.items():
+                value[direction + 'Count'] = baseline.count
+                value[direction + 'Anomalies'] = baseline.anomalies
+                if baseline.count > 0:
+                    value[direction + 'Baseline'] = round(baseline.mean, 3)
+                    value[direction + 'Stddev'] = round(
+                            math.sqrt(baseline.variance), 3)
+                    value[direction + 'Min'] = round(baseline.minimum, 3)
+            yield value
+
+    def totals(self):
+        """
+        Dictionary of counts of input lines, invalid lines, tests, clients
+        kept and dropped, and anomalies.
+        """
+        return collections.OrderedDict((
+                ('lines', self._lines),
+                ('invalidLines', self._invalidLines),
+                ('tests', self._tests),
+                ('clients', len(self._clients)),
+                ('droppedClients', self._droppedClients),
+                ('anomalies', self._anomalies),
+        ))
+
+if __name__ == "__main__":
+    cmdline = getopt.getopt(sys.argv[1:], 'h',
+                            longopts=['help', 'fraction=', 'alpha=',
+                                        'warmup=', 'maxclients='])
+    argv = cmdline[1]
+    opt = dict(cmdline[0])
+
+    def printerr(s):
+        print(s, file=sys.stderr)
+        sys.stderr.flush()
+
+    if '-h' in opt or '--help' in opt:
+        printerr("Usage: " + sys.argv[0] + " [options] [filename ...]")
+        printerr("       Find intermittent low speeds in JSON logs")
+        printerr("       Input: JSON name-value pairs, one JSON per line,")
+        printerr("              from client.py or server.js")
+        printerr("   Options:")
+        printerr("       -h|--help      print this message")
+        printerr("      --fraction=f    anomaly if speed < f * baseline"
+              + " (default = " + str(AnomalyDetector.defaultFraction) + ")")
+        printerr("      --alpha=a       weight of newest speed in baseline"
+              + " (default = " + str(AnomalyDetector.defaultAlpha) + ")")
+        printerr("      --warmup=n      tests before baseline is used"
+              + " (default = " + str(AnomalyDetector.defaultWarmup) + ")")
+        printerr("      --maxclients=n  most clients kept, least recently"
+              + " seen are dropped")
+        printerr("                      (default = "
+              + str(AnomalyDetector.defaultMaxClients) + ")")
+        printerr("   Alerts (JSON) go to stdout")
+        printerr("   Per-client summary and totals (JSON) go to stderr")
+        printerr("   See script for details")
+        exit(1)
+
+    fraction = (float(opt['--fraction']) if '--fraction' in opt
+                                        else AnomalyDetector.defaultFraction)
+    alpha = (float(opt['--alpha']) if '--alpha' in opt
+                                        else AnomalyDetector.defaultAlpha)
+    warmup = (int(opt['--warmup']) if '--warmup' in opt
+                                        else AnomalyDetector.defaultWarmup)
+
+    maxClients = (int(opt['--maxclients']) if '--maxclients' in opt
+                                        else AnomalyDetector.defaultMaxClients)
+
+    detector = AnomalyDetector(fraction=fraction, alpha=alpha, warmup=warmup,
+                                maxClients=maxClients)
+    if len(argv) > 0:
+        for filename in argv:
+            with open(filename, newline='') as lineReader:
+                detector.copy(lineReader, sys.stdout)
+    else:
+        detector.copy(sys.stdin, sys.stdout)
+    sys.stdout.flush()
+
+    for value in detector.summary():
+        print(json.dumps(value), file=sys.stderr)
+    print(json.dumps(detector.totals()), file=sys.stderr)
+    sys.stderr.flush()
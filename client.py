@@ -6,14 +6,18 @@ import sys
 import collections
 import gc
 import getopt
+import http.client
 import json
 import math
 import time
 import traceback
 import urllib.error
+import urllib.parse
 import urllib.request
 import re
 
+from jsonformat import JsonFormat
+
 class Client(object):
     """
     Python class and connmand line client for repeated internet speed tests.
@@ -35,6 +39,12 @@ class Client(object):
     maxRatio = 1.5          # minimum time devation to cause change in length
 
     maxUploadLength = 125_000_000   # upload will fail if upload is too large
+
+    # defaults for sweep of transmit lengths -- treat as class constants
+    sweepMinLength = 10_000             # first length of each sweep
+    sweepFactor = 4                     # ratio of successive lengths
+    sweepBytes = 200_000_000            # most bytes per sweep, both ways
+    sweepSeconds = 30                   # most time per sweep
     # download limit is unknown, seems to be more than 1_000_000_000
 
     # default output destimations
@@ -71,7 +81,11 @@ class Client(object):
                         interval=defaultInterval,
                         downloadLength=initialDownloadLength,
                         uploadLength=initialUploadLength,
-                        testID = None   # default: will be set by the server
+                        testID = None,  # default: will be set by the server
+                        binlog=None,    # binary log of transactions
+                        sweep=False,    # sweep of lengths in each cycle
+                        sweepBytes=sweepBytes,
+                        sweepSeconds=sweepSeconds
                         ):
         """
         Create an instance for download and upload tests.
@@ -80,6 +94,12 @@ class Client(object):
         slash will be appended if trailing slash is omitted.
         report and log are the names of output destinations of destinations ins
         the local filesystem.
+        binlog, if not None, is a binary file that will receive a compact
+        copy of the log (see JsonFormat.BinaryWriter).  log may be None
+        if only the binary log is wanted.
+        If sweep is true, each test cycle is a sweep of lengths limited by
+        sweepBytes and sweepSeconds (see sweepTest()) instead of a single
+        download and upload test.
         """
 
         super()
@@ -88,6 +108,8 @@ class Client(object):
         self._serverURL = (serverURL.rstrip('/')
                                 if serverURL.endswith('/')
                                 else serverURL)
+        # Path of server on its host, prefix to paths relative to server
+        self._serverPath = urllib.parse.urlsplit(self._serverURL).path
         # Paths relative to server
         self._rootPath = '/'
         self._setupPath = '/begin'
@@ -100,6 +122,8 @@ class Client(object):
         # output to file system
         self._report = report
         self._log = log
+        self._binlog = (JsonFormat.BinaryWriter(binlog) if binlog
+                                                        else None)
     
         # Initial settings
         self._interval = ( interval if interval
@@ -114,6 +138,9 @@ class Client(object):
         self._testBegin = None      # date-time of first contact with server
         # prevent upload failure caused by large uploads
         self._uploadLength = min(self.maxUploadLength, self._uploadLength)
+        self._sweep = sweep
+        self._sweepBytes = sweepBytes
+        self._sweepSeconds = sweepSeconds
 
     def recalculateLength(self, previousLength, previousRuntime):
         """
@@ -140,6 +167,17 @@ class Client(object):
         transmitLength = previousLength * targetRuntime / lastRuntime
         return max(minLength, min(maxLength, round(transmitLength, -3)))
 
+    def logRecord(self, params):
+        """
+        Write a computer-readable record to the JSON and binary logs.
+        """
+        if self._log:
+            print(json.dumps(params), file=self._log)
+            self._log.flush()
+        if self._binlog:
+            self._binlog.writeDict(params)
+            self._binlog.writer.flush()
+
     def bytesource(self, count):
         """
         Iterate a sequence of blocks of bytes.
@@ -194,8 +232,7 @@ class Client(object):
                 self._downloadLength = info["downloadLength"]
                 self._uploadLength = info["uploadLength"]
                 self._testBegin = info['testBegin']
-                print(json.dumps(info), file=self._log)
-                self._log.flush()
+                self.logRecord(info)
                 print( 'Begin:\n    Test ID = ' + info['testID']
                         + '\n    External IP = ' + info['externalIP']
                         + '\n    Test Begin Time = '
@@ -327,8 +364,7 @@ class Client(object):
         params = self.download(params)
 
         # computer-readable JSON report
-        print(json.dumps(params), file=self._log)
-        self._log.flush()
+        self.logRecord(params)
         # human-readable repot
         megabytes = math.floor(params['clientReceiveLength'] / 1_000) / 1_000
         seconds = (params['clientResponseEnd']
@@ -350,8 +386,7 @@ class Client(object):
         params = self.reportToServer(params, self._downreportPath)
 
         # computer-readable JSON report
-        print(json.dumps(params), file=self._log)
-        self._log.flush()
+        self.logRecord(params)
 
         return
 
@@ -448,8 +483,7 @@ class Client(object):
         params = self.upload(params)
 
         # computer-readable JSON report
-        print(json.dumps(params), file=self._log)
-        self._log.flush()
+        self.logRecord(params)
         # human-readable repot
         megabytes = math.floor(params['uploadLength'] / 1_000) / 1_000
         seconds = (params['clientResponseEnd']
@@ -471,17 +505,181 @@ class Client(object):
         params = self.reportToServer(params, self._upreportPath)
 
         # computer-readable JSON report
-        print(json.dumps(params), file=self._log)
-        self._log.flush()
+        self.logRecord(params)
+
+        return
+
+    def sweepLengths(self):
+        """
+        Iterate a geometric series of transmit lengths for a sweep.
+
+        Lengths begin at sweepMinLength and stop at maxLength.
+        """
+        length = self.sweepMinLength
+        while length <= self.maxLength:
+            yield length
+            length *= self.sweepFactor
+
+    def sweepTransfer(self, connection, direction, length):
+        """
+        Download or upload one length of data on an open connection.
+
+        This is one point of a sweep and is invoked by sweepTest().
+
+        Returns the number of bytes received at the far end, the time in
+        seconds from the start of the request to the end of the response,
+        which includes any slow start of the connection, and the client IP
+        seen by the server (None for a download, which has no reply).
+        """
+        receiveLength = 0
+        externalIP = None
+        if direction == 'download':
+            params = collections.OrderedDict((
+                    ('externalIP', self._externalIP),
+                    ('testID', self._testID),
+                    ('testBegin', self._testBegin),
+                    ('testNumber', self._testNumber),
+                    ('pathname', self._downloadPath),
+                    ('clientTimestamp', self.js_time()),
+                    ('interval', self._interval),
+                    ('downloadLength', length),
+            ))
+            path = self._downloadPath
+            body = bytes(json.dumps(params), 'utf-8')
+            headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'text/plain, application/octet',
+            }
+        else:
+            path = self._uploadPath
+            body = self.bytesource(length)
+            headers = {
+                'Content-Type': 'application/octet',
+                'Content-Length': str(length),
+                'Accept': 'application/json',
+            }
+        begin = time.perf_counter()
+        connection.request('POST', self._serverPath + path, body=body,
+                            headers=headers)
+        response = connection.getresponse()
+        if response.status != 200:
+            # body is an error page, not test data or a JSON reply
+            raise RuntimeError('HTTP status ' + str(response.status)
+                                + ' from ' + path)
+        if direction == 'download':
+            size = len(response.read(16_384))
+            while size > 0:
+                receiveLength += size
+                size = len(response.read(65_536))
+            seconds = time.perf_counter() - begin
+        else:
+            info = json.loads(response.read())  # short JSON reply
+            seconds = time.perf_counter() - begin
+            receiveLength = info['uploadReceiveLength']
+            externalIP = info.get('externalIP')
+        return receiveLength, seconds, externalIP
+
+    def sweepTest(self):
+        """
+        Run downloads and uploads of increasing length, one of each length.
+
+        Lengths are from sweepLengths().  The sweep stops before a length
+        that would exceed the byte budget, or that would be expected from
+        the last speed to run past the time budget.  All transfers share
+        one connection to the server while the server keeps it open.
+
+        Logs one record with a 'sweep' list of the speed at each length,
+        which jsonformat.py --sweep can flatten for plotting.  The record's
+        externalIP is the client IP seen by the server in upload replies.
+        """
+
+        gc.collect()    # try to avoid garbage collection during test
+
+        timestamp = self.js_time()
+        url = urllib.parse.urlsplit(self._serverURL)
+        connectionClass = (http.client.HTTPSConnection
+                                if url.scheme == 'https'
+                                else http.client.HTTPConnection)
+        connection = connectionClass(url.netloc)
+        sweep = []
+        sentBytes = 0
+        begin = time.perf_counter()
+        seconds = {'download': 0, 'upload': 0}  # last time for each direction
+        lastLength = 0
+        # client IP seen by the server, from the replies to uploads
+        sweepExternalIP = self._externalIP
+        try:
+            for length in self.sweepLengths():
+                uploadLength = min(length, self.maxUploadLength)
+                if sentBytes + length + uploadLength > self._sweepBytes:
+                    break       # byte budget
+                # time expected if time is proportional to length
+                expected = ((seconds['download'] + seconds['upload'])
+                                * length / lastLength if lastLength else 0)
+                if (time.perf_counter() - begin + expected
+                        > self._sweepSeconds):
+                    break       # time budget
+                for direction, dataLength in (('download', length),
+                                              ('upload', uploadLength)):
+                    (receiveLength, seconds[direction],
+                        externalIP) = self.sweepTransfer(connection,
+                                                    direction, dataLength)
+                    if externalIP:
+                        sweepExternalIP = externalIP
+                    sweep.append(collections.OrderedDict((
+                        ('direction', direction),
+                        ('length', dataLength),
+                        ('receiveLength', receiveLength),
+                        ('seconds', round(seconds[direction], 6)),
+                        ('megabitsPerSecond', round(
+                            self.bitsPerDataByte * receiveLength
+                                / max(seconds[direction], 1e-6)
+                                / 1_000_000, 3)),
+                    )))
+                    sentBytes += dataLength
+                lastLength = length
+        except Exception as e:
+            raise RuntimeError('timestamp=' + ': '.join([str(timestamp),
+                           'Failed to sweep lengths with server at',
+                           self._serverURL])) from e
+        finally:
+            connection.close()
+
+        params = collections.OrderedDict((
+                ('externalIP', sweepExternalIP),
+                ('testID', self._testID),
+                ('testBegin', self._testBegin),
+                ('testNumber', self._testNumber),
+                ('pathname', '/sweep'),
+                ('clientTimestamp', timestamp),
+                ('interval', self._interval),
+                ('sweep', sweep),
+        ))
+
+        # computer-readable JSON report
+        self.logRecord(params)
+        # human-readable report
+        lines = ['Sweep\n    Time: ' + self.js_clock(timestamp)]
+        for point in sweep:
+            lines.append('    ' + point['direction'].capitalize()
+                            + ' bytes: ' + str(point['length'])
+                            + '  Megabits / Second: '
+                            + str(point['megabitsPerSecond']))
+        print('\n'.join(lines) + '\n', file=self._report)
+        self._report.flush()
 
         return
 
     def run_test_cycle(self):
         """
-        Run a single set of upload and upload tests.
+        Run a single set of upload and upload tests, or a single sweep.
         """
-        self.downloadTest()
-        self.uploadTest()
+        if self._sweep:
+            self.sweepTest()
+        else:
+            self.downloadTest()
+            self.uploadTest()
+        self._testNumber += 1
 
     def run(self):
         """
@@ -494,7 +692,8 @@ class Client(object):
 
 if __name__ == "__main__":
     shortopts = "h"
-    longopts = ["help", "testid=", "interval=", "download=", "upload="]
+    longopts = ["help", "testid=", "interval=", "download=", "upload=",
+                "binlog=", "sweep", "sweepbytes=", "sweepseconds="]
     cmdline = getopt.getopt(sys.argv[1:], shortopts, longopts=longopts)
     argv = cmdline[1]
     opt = dict(cmdline[0])
@@ -519,6 +718,14 @@ if __name__ == "__main__":
               + " (default = " + str(Client.initialUploadLength) + ")")
         printerr("      --testid=ID    test ID"
               + " (default = test ID will be set by server)")
+        printerr("      --binlog=FILE  append binary log to FILE"
+              + " instead of JSON log to stdout")
+        printerr("      --sweep        each run is a sweep of lengths"
+              + " instead of one download and upload")
+        printerr("      --sweepbytes=n   most bytes per sweep"
+              + " (default = " + str(Client.sweepBytes) + ")")
+        printerr("      --sweepseconds=n most seconds per sweep"
+              + " (default = " + str(Client.sweepSeconds) + ")")
         printerr("   JSON log goes to stdout")
         printerr("   Human-readable report goes to stderr")
         printerr("   See script for details")
@@ -533,11 +740,27 @@ if __name__ == "__main__":
     upload = (int(opt["--upload"]) if "--upload" in opt
                                     else Client.initialUploadLength)
 
+    sweep = "--sweep" in opt
+    sweepBytes = (int(opt["--sweepbytes"]) if "--sweepbytes" in opt
+                                            else Client.sweepBytes)
+    sweepSeconds = (float(opt["--sweepseconds"]) if "--sweepseconds" in opt
+                                            else Client.sweepSeconds)
+
+    binlog = open(opt["--binlog"], 'ab') if "--binlog" in opt else None
+
     try:
-        Client(argv[0], interval=interval,
+        Client(argv[0], log=(None if binlog else Client.defaultLog),
+                        interval=interval,
                         downloadLength=download,
                         uploadLength=upload,
-                        testID=testID).run()
+                        testID=testID,
+                        binlog=binlog,
+                        sweep=sweep,
+                        sweepBytes=sweepBytes,
+                        sweepSeconds=sweepSeconds).run()
     except KeyboardInterrupt as e:
         printerr("Teiminated by Keyboard Interrupt\n")
         exit(1)
+    finally:
+        if binlog:
+            binlog.close()
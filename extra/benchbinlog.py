@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# Size and parse speed of binary log records compared with JSON lines.
+
+# Uses the records of a JSON log from client.py or server.js, for example:
+#
+#     ./benchbinlog.py server-log.json
+#
+# or, without a file name, the given number of made-up test records.
+# Each format is read and converted to CSV (as by jsonformat.py) in memory,
+# so the times do not include disk input and output.
+
+import os
+import sys
+import getopt
+import io
+import json
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from jsonformat import JsonFormat
+
+def makeRecords(count):
+    """
+    Iterate made-up JSON lines like those of a server log.
+    """
+    random.seed(count)
+    timestamp = 1_600_000_000_000
+    paths = ('/download', '/downreport', '/upload', '/upreport')
+    for n in range(count):
+        externalIP = '10.0.' + str(n % 7) + '.' + str(n % 251)
+        timestamp += random.randint(1, 1000)
+        value = {
+            'testID': externalIP + '-1600000000000-' + str(n % 1000),
+            'externalIP': externalIP,
+            'testBegin': 1_600_000_000_000,
+            'testNumber': n // 4,
+            'pathname': paths[n % 4],
+            'clientTimestamp': timestamp,
+            'interval': 3600,
+            'downloadLength': 20_000_000,
+            'clientReceiveLength': 20_000_000,
+            'downloadReceiveLength': 20_000_000,
+            'clientRequestBegin': timestamp + 1,
+            'clientRequestEnd': timestamp + 2,
+            'clientResponseBegin': timestamp + 3,
+            'clientResponseEnd': timestamp + random.randint(1000, 20000),
+            'serverTimestamp': timestamp + 1,
+            'serverRequestBegin': timestamp + 1,
+            'serverRequestEnd': timestamp + 2,
+            'serverResponseBegin': timestamp + 2,
+            'serverReceiveLength': 400,
+            'serverResponseEnd': timestamp + 3,
+        }
+        yield json.dumps(value) + '\n'
+
+def timed(function, *args):
+    """
+    Run a function, return the elapsed time in seconds.
+    """
+    begin = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - begin
+
+def parseJson(text):
+    for line in io.StringIO(text):
+        json.loads(line)
+
+def parseBinary(data):
+    for value in JsonFormat.BinaryReader(io.BytesIO(data)):
+        pass
+
+def benchmark(text):
+    """
+    Compare JSON lines with binary records, return a dictionary of results.
+    """
+    binary = io.BytesIO()
+    JsonFormat.copy(io.StringIO(text), binary, isBinary=True)
+    data = binary.getvalue()
+    records = text.count('\n')
+
+    result = {
+        'records': records,
+        'jsonBytes': len(text.encode('utf-8')),
+        'binaryBytes': len(data),
+    }
+    result['sizeRatio'] = round(result['binaryBytes'] / result['jsonBytes'], 3)
+    for name, function, source in (
+            ('jsonParseSeconds', parseJson, text),
+            ('binaryParseSeconds', parseBinary, data),
+            ('jsonToCsvSeconds', lambda t: JsonFormat.copy(io.StringIO(t),
+                                                    io.StringIO()), text),
+            ('binaryToCsvSeconds', lambda d: JsonFormat.copyBinary(
+                                    io.BytesIO(d), io.StringIO()), data),
+            ):
+        result[name] = round(timed(function, source), 3)
+    for name, json_seconds, binary_seconds in (
+            ('parseSpeedup', 'jsonParseSeconds', 'binaryParseSeconds'),
+            ('toCsvSpeedup', 'jsonToCsvSeconds', 'binaryToCsvSeconds'),
+            ):
+        result[name] = (round(result[json_seconds] / result[binary_seconds],
+                                2) if result[binary_seconds] > 0 else None)
+    return result
+
+if __name__ == "__main__":
+    cmdline = getopt.getopt(sys.argv[1:], 'h', longopts=['help', 'count='])
+    argv = cmdline[1]
+    opt = dict(cmdline[0])
+
+    def printerr(s):
+        print(s, file=sys.stderr)
+        sys.stderr.flush()
+
+    if len(argv) > 1 or '-h' in opt or '--help' in opt:
+        printerr("Usage: " + sys.argv[0] + " [-h|--help] [--count=n]"
+                 + " [filename]")
+        printerr("       Compare binary log records with JSON lines")
+        printerr("       Input: JSON log from client.py or server.js")
+        printerr("   Options:")
+        printerr("       -h|--help     print this message")
+        printerr("       --count=n     number of made-up records if there is"
+                 + " no input file (default = 100000)")
+        printerr("   JSON result goes to stdout")
+        printerr("   See script for details")
+        exit(1)
+
+    if len(argv) > 0:
+        with open(argv[0], newline='') as f:
+            text = ''.join(line for line in f if line.strip() != '')
+    else:
+        count = int(opt['--count']) if '--count' in opt else 100_000
+        text = ''.join(makeRecords(count))
+
+    print(json.dumps(benchmark(text)))
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+# Download throughput benchmark, driven by the command line client.
+
+# Run the server on the same machine, then run this script against the
+# loopback address, for example:
+#
+#     ../server.js > /dev/null &
+#     ./benchdownload.py --pid=$! http://127.0.0.1:8080
+#
+# Each stream repeatedly downloads the requested length with
+# Client.download().  Reports total throughput and, when the server process
+# id is given, throughput per second of server CPU time (one core).  Server
+# CPU time is read from /proc, so that figure is available only on Linux.
+
+import os
+import sys
+import getopt
+import json
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from client import Client
+
+class DownloadBenchmark(object):
+    """
+    Repeated downloads from a server on one or more concurrent streams.
+    """
+
+    defaultLength = 100_000_000     # bytes per download
+    defaultCount = 10               # downloads per stream
+    defaultStreams = 1              # concurrent downloads
+
+    @classmethod
+    def cpu_seconds(cls, pid):
+        """
+        User plus system CPU time of a process, in seconds.
+
+        Returns None if the process can not be found in /proc.
+        """
+        try:
+            with open('/proc/' + str(pid) + '/stat') as f:
+                stat = f.read()
+        except OSError:
+            return None
+        # process name may contain spaces, fields after it are fixed
+        fields = stat[stat.rindex(')') + 2:].split()
+        ticks = int(fields[11]) + int(fields[12])   # utime + stime
+        return ticks / os.sysconf('SC_CLK_TCK')
+
+    def __init__(self,  serverURL,
+                        length=defaultLength,
+                        count=defaultCount,
+                        streams=defaultStreams,
+                        serverPID=None
+                        ):
+        self._client = Client(serverURL, log=None, report=None,
+                                downloadLength=length)
+        self._length = length
+        self._count = count
+        self._streams = streams
+        self._serverPID = serverPID
+        self._received = [0] * streams
+        self._errors = []
+
+    def stream(self, index):
+        """
+        Run the downloads for one stream and count the received bytes.
+        """
+        try:
+            for n in range(self._count):
+                params = {
+                    'testID': 'benchmark',
+                    'testNumber': n,
+                    'downloadLength': self._length,
+                }
+                params = self._client.download(params)
+                self._received[index] += params['clientReceiveLength']
+        except Exception as e:
+            self._errors.append(e)
+
+    def run(self):
+        """
+        Run all streams to completion and return a dictionary of results.
+        """
+        threads = [threading.Thread(target=self.stream, args=(i,))
+                        for i in range(self._streams)]
+        serverCPU = (self.cpu_seconds(self._serverPID)
+                        if self._serverPID else None)
+        clientCPU = time.process_time()
+        begin = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - begin
+        clientCPU = time.process_time() - clientCPU
+        if serverCPU is not None:
+            serverCPU = self.cpu_seconds(self._serverPID) - serverCPU
+        if self._errors:
+            raise RuntimeError(str(len(self._errors))
+                                + ' download(s) failed') from self._errors[0]
+
+        received = sum(self._received)
+        megabits = Client.bitsPerDataByte * received / 1_000_000
+        result = {
+            'streams': self._streams,
+            'downloads': self._streams * self._count,
+            'bytes': received,
+            'seconds': round(seconds, 3),
+            'megabitsPerSecond': round(megabits / seconds, 3),
+            'clientCPUSeconds': round(clientCPU, 3),
+        }
+        if serverCPU is not None:
+            result['serverCPUSeconds'] = round(serverCPU, 3)
+            result['megabitsPerServerCPUSecond'] = (
+                    round(megabits / serverCPU, 3) if serverCPU > 0 else None)
+        return result
+
+if __name__ == "__main__":
+    shortopts = "h"
+    longopts = ["help", "length=", "count=", "streams=", "pid="]
+    cmdline = getopt.getopt(sys.argv[1:], shortopts, longopts=longopts)
+    argv = cmdline[1]
+    opt = dict(cmdline[0])
+
+    def printerr(s):
+        print(s, file=sys.stderr)
+        sys.stderr.flush()
+
+    if len(argv) != 1 or '-h' in opt or '--help' in opt:
+        printerr("Usage: " + sys.argv[0] + " [options] url")
+        printerr("       Measure download throughput from a server")
+        printerr("     url (required): location of server")
+        printerr("   options:")
+        printerr("       -h|--help     print this message")
+        printerr("      --length=n     number of bytes per download"
+              + " (default = " + str(DownloadBenchmark.defaultLength) + ")")
+        printerr("      --count=n      downloads per stream"
+              + " (default = " + str(DownloadBenchmark.defaultCount) + ")")
+        printerr("      --streams=n    concurrent download streams"
+              + " (default = " + str(DownloadBenchmark.defaultStreams) + ")")
+        printerr("      --pid=n        server process ID, to report"
+              + " throughput per server CPU second")
+        printerr("   JSON result goes to stdout")
+        printerr("   See script for details")
+        exit(2)
+
+    length = (int(opt["--length"]) if "--length" in opt
+                                    else DownloadBenchmark.defaultLength)
+    count = (int(opt["--count"]) if "--count" in opt
+                                    else DownloadBenchmark.defaultCount)
+    streams = (int(opt["--streams"]) if "--streams" in opt
+                                    else DownloadBenchmark.defaultStreams)
+    serverPID = int(opt["--pid"]) if "--pid" in opt else None
+
+    result = DownloadBenchmark(argv[0], length=length, count=count,
+                                streams=streams, serverPID=serverPID).run()
+    print(json.dumps(result))
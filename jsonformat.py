@@ -6,8 +6,11 @@ import sys
 import collections
 import csv
 import getopt
+import io
 import json
 import math
+import operator
+import struct
 import time
 
 class JsonFormat(object):
@@ -55,6 +58,48 @@ class JsonFormat(object):
         "error",
     )
 
+    # Compact binary format, see BinaryWriter
+    # fields listed in testInfo, times, and appendix have fixed positions
+    # in each record: strings as string table indexes, others as integers
+    binaryMagic = b'NSPD'
+    binaryVersion = 1
+    binaryStrings = (
+        "testID",
+        "externalIP",
+        "pathname",
+        "error",
+    )
+
+    # Rows of a sweep of lengths from 'client.py --sweep'
+    # one row for each point of the 'sweep' list of a record
+    sweepInfo = (
+        "testID",
+        "externalIP",
+        "testNumber",
+        "clientTimestamp",
+    )
+    sweepPoint = (
+        "direction",
+        "length",
+        "receiveLength",
+        "seconds",
+        "megabitsPerSecond",
+    )
+
+    # Rows of a speed summary from the server's '/stats' URL
+    # speeds are megabits per second, times are as for 'times'
+    statsInfo = (
+        "serverTimestamp",
+        "scope",
+        "externalIP",
+        "testID",
+        "lastTimestamp",
+    )
+    statsSpeeds = tuple(direction + measure
+                        for direction in ("download", "upload")
+                        for measure in ("Count", "Min", "P10", "P50", "P90",
+                                        "Max"))
+
     @classmethod
     def formatTime(cls, milliseconds):
         """
@@ -75,7 +120,56 @@ class JsonFormat(object):
         super().__init__()
 
     @classmethod
-    def copy(cls, lineReader, writer, isRaw=False, isJsonFormat=False):
+    def reorder(cls, value, isRaw=False, isAll=False):
+        """
+        Copy a dictionary to an OrderedDict with names in output order.
+
+        value       dictionary from one input record
+        isRaw       Whether times are to be output without reformatting
+        isAll       Whether to copy names not listed in the CSV headings
+        """
+        newdict = collections.OrderedDict()
+        for name in cls.testInfo:
+            if name in value:
+                newdict.setdefault(name, value[name])
+        for name in cls.times:
+            if name in value:
+                if isRaw:
+                    # milliseconds from Unix epoch
+                    newdict.setdefault(name, value[name])
+                else:
+                    # human-readable local date and time
+                    newdict.setdefault(name, cls.formatTime(value[name]))
+        for name in cls.appendix:
+            if name in value:
+                newdict.setdefault(name, value[name])
+        if isAll:
+            # names not listed in CSV headings
+            # Copy as-is to JSON, but not to CSV
+            # Each CSV row has same number of columns, no extra columns
+            for name in value:
+                if not name in newdict:
+                    newdict.setdefault(name, value[name])
+        return newdict
+
+    @classmethod
+    def dictWriter(cls, writer, isJsonFormat=False, isBinary=False):
+        """
+        Return the writeDict() method of a writer for the output format.
+        """
+        if isBinary:        # binary, writer accepts bytes
+            return cls.BinaryWriter(writer).writeDict
+        elif isJsonFormat:  # JSON
+            return cls.JsonWriter(writer).writeDict
+        else:               # CSV
+            names = list(cls.testInfo)
+            names.extend(list(cls.times))
+            names.extend(list(cls.appendix))
+            return cls.CsvWriter(writer, names).writeDict
+
+    @classmethod
+    def copy(cls, lineReader, writer, isRaw=False, isJsonFormat=False,
+                                      isBinary=False):
         """
         Transform JSON input text to CSV output text, with headings.
 
@@ -87,17 +181,15 @@ class JsonFormat(object):
                 string and does not append a terninaiing newline.
         isRaw       Whether times are to be output without reformatting
         isJsonFormat    Whether output should be JSON instead of CSV
+        isBinary    Whether output should be binary instead of CSV, in
+                    which case writer must accept bytes and times are raw
         """
         MaxJsonLength = 4096        # including a newline
 
         # output format
-        if isJsonFormat:    # JSON
-            writeDict = cls.JsonWriter(writer).writeDict
-        else:               # CSV
-            names = list(cls.testInfo)
-            names.extend(list(cls.times))
-            names.extend(list(cls.appendix))
-            writeDict = cls.CsvWriter(writer, names).writeDict
+        writeDict = cls.dictWriter(writer, isJsonFormat, isBinary)
+        isRaw = isRaw or isBinary
+        isAll = isJsonFormat or isBinary
         try:
             # create and output dictionary from eadh input line (JSON literal)
             line = lineReader.readline(MaxJsonLength)
@@ -110,33 +202,141 @@ class JsonFormat(object):
                 else:
                     value = json.loads(line.strip())    # ordered dictionary
 
-                newdict = collections.OrderedDict()
-                for name in cls.testInfo:
-                    if name in value:
-                        newdict.setdefault(name, value[name])
-                for name in cls.times:
+                writeDict(cls.reorder(value, isRaw, isAll))
+
+                line = lineReader.readline(MaxJsonLength)
+        except Exception as e:
+            # Error is most likely due to error in creating the inpuy
+            raise RuntimeError('Error at line ' + str(line_num)
+                                + ' of input.') from e
+
+    @classmethod
+    def copyBinary(cls, byteReader, writer, isRaw=False, isJsonFormat=False,
+                                            isBinary=False):
+        """
+        Transform binary input records to CSV output text, with headings.
+
+        byteReader is a binary source with a read() method, such as a file
+        written by BinaryWriter.  Other arguments are as for copy().
+        """
+        writeDict = cls.dictWriter(writer, isJsonFormat, isBinary)
+        isRaw = isRaw or isBinary
+        isAll = isJsonFormat or isBinary
+        record_num = 0
+        try:
+            for value in cls.BinaryReader(byteReader):
+                record_num += 1
+                writeDict(cls.reorder(value, isRaw, isAll))
+        except Exception as e:
+            raise RuntimeError('Error at record ' + str(record_num + 1)
+                                + ' of input.') from e
+
+    @classmethod
+    def isBinaryInput(cls, byteReader):
+        """
+        Whether a buffered binary source begins with a binary format header.
+
+        Does not consume any input.
+        """
+        return byteReader.peek(len(cls.binaryMagic)).startswith(
+                                                        cls.binaryMagic)
+
+    @classmethod
+    def readJson(cls, lineReader):
+        """
+        Iterate dictionaries from JSON lines, skipping blank lines.
+        """
+        for line in lineReader:
+            strippedLine = line.strip()
+            if strippedLine != '':
+                yield json.loads(strippedLine)
+
+    @classmethod
+    def copySweep(cls, values, writer, isRaw=False, isJsonFormat=False):
+        """
+        Flatten sweeps of lengths to CSV text, with headings.
+
+        values is an iterable of dictionaries, such as from readJson() or
+        BinaryReader.  Each record with a 'sweep' list, as logged by
+        'client.py --sweep', becomes one row for each point of the list,
+        so that speed can be plotted against length for each test cycle.
+        Other records are skipped.
+
+        writer, isRaw, and isJsonFormat are as for copy().
+        """
+        names = list(cls.sweepInfo)
+        names.extend(list(cls.sweepPoint))
+        if isJsonFormat:    # JSON
+            writeDict = cls.JsonWriter(writer).writeDict
+        else:               # CSV
+            writeDict = cls.CsvWriter(writer, names).writeDict
+        record_num = 0
+        try:
+            for value in values:
+                record_num += 1
+                if not 'sweep' in value:
+                    continue
+                info = collections.OrderedDict()
+                for name in cls.sweepInfo:
                     if name in value:
-                        if isRaw:
-                            # milliseconds from Unix epoch
-                            newdict.setdefault(name, value[name])
+                        if name in cls.times and not isRaw:
+                            info.setdefault(name, cls.formatTime(value[name]))
                         else:
-                            # human-readable local date and time
-                            newdict.setdefault(name,
-                                                cls.formatTime(value[name]))
-                for name in cls.appendix:
-                    if name in value:
-                        newdict.setdefault(name, value[name])
-                if isJsonFormat:
-                    # names not listed in CSV headings
-                    # Copy as-is to JSON, but not to CSV
-                    # Each CSV row has same number of columns, no extra columns
-                    for name in value:
-                        if not name in newdict:
-                            newdict.setdefault(name, value[name])
+                            info.setdefault(name, value[name])
+                for point in value['sweep']:
+                    newdict = collections.OrderedDict(info)
+                    for name in cls.sweepPoint:
+                        if name in point:
+                            newdict.setdefault(name, point[name])
+                    writeDict(newdict)
+        except Exception as e:
+            raise RuntimeError('Error at record ' + str(record_num)
+                                + ' of input.') from e
+
+    @classmethod
+    def copyStats(cls, lineReader, writer, isRaw=False, isJsonFormat=False):
+        """
+        Transform speed summaries from the server to CSV text, with headings.
 
-                writeDict(newdict)
+        lineReader is a text source with a readline() method.
+        Each input line is the JSON object returned by the server's '/stats'
+        URL, so a file of summaries can be made by appending the replies
+        to repeated requests.  Each summary becomes one row for all clients
+        together (scope 'global') and one row for each client.
 
-                line = lineReader.readline(MaxJsonLength)
+        writer, isRaw, and isJsonFormat are as for copy().
+        """
+        timeNames = ("serverTimestamp", "lastTimestamp")
+        names = list(cls.statsInfo)
+        names.extend(list(cls.statsSpeeds))
+        if isJsonFormat:    # JSON
+            writeDict = cls.JsonWriter(writer).writeDict
+        else:               # CSV
+            writeDict = cls.CsvWriter(writer, names).writeDict
+        try:
+            line = lineReader.readline()
+            line_num = 0
+            while len(line) > 0:
+                line_num += 1
+                strippedLine = line.strip()
+                if strippedLine != '':
+                    summary = json.loads(strippedLine)
+                    rows = [summary["global"]]
+                    rows.extend(summary["clients"])
+                    for row in rows:
+                        value = dict(row)
+                        value["serverTimestamp"] = summary["serverTimestamp"]
+                        newdict = collections.OrderedDict()
+                        for name in names:
+                            if name in value:
+                                if name in timeNames and not isRaw:
+                                    newdict.setdefault(name,
+                                                cls.formatTime(value[name]))
+                                else:
+                                    newdict.setdefault(name, value[name])
+                        writeDict(newdict)
+
+                line = lineReader.readline()
         except Exception as e:
             # Error is most likely due to error in creating the inpuy
             raise RuntimeError('Error at line ' + str(line_num)
@@ -180,9 +380,210 @@ class JsonFormat(object):
         def writeDict(self, valueDict):
             self.writer.write(json.dumps(valueDict) + '\n')
 
+    class BinaryWriter(object):
+        """
+        Write dictionaries as compact fixed-layout binary records.
+
+        The output begins with a header, followed by string definitions and
+        records in any order.  All integers are little-endian.
+
+        Header:     magic b'NSPD', version (uint16), field count (uint16),
+                    then for each field a type code (b'I' string index or
+                    b'q' int64), name length (uint8), and name (ASCII)
+        String:     b'S', length (uint32), UTF-8 text.  Strings are numbered
+                    from zero in order of definition, each string is
+                    defined once, before the first record that uses it.
+        Record:     b'R', presence bit mask (uint32), one value for each
+                    field of the header, then the length (uint32) of the
+                    UTF-8 JSON text that follows, which holds any other
+                    names and values (bit 31 of mask).  This text is
+                    nearly always different for each record, so it is not
+                    kept in the string table.
+
+        A reader that finds a new header after some records begins a new
+        string table, so binary files may be concatenated or appended to.
+        """
+        extraBit = 1 << 31
+
+        def __init__(self, writer):
+            self.writer = writer
+            self.names = list(JsonFormat.testInfo)
+            self.names.extend(list(JsonFormat.times))
+            self.names.extend(list(JsonFormat.appendix))
+            self.codes = [(b'I' if name in JsonFormat.binaryStrings else b'q')
+                                for name in self.names]
+            self.isString = [code == b'I' for code in self.codes]
+            self.nameSet = frozenset(self.names)
+            self.record = struct.Struct('<cI'
+                                + b''.join(self.codes).decode('ascii') + 'I')
+            self.strings = {}       # string table, text -> index
+            header = [JsonFormat.binaryMagic,
+                        struct.pack('<HH', JsonFormat.binaryVersion,
+                                            len(self.names))]
+            for name, code in zip(self.names, self.codes):
+                encoded = name.encode('ascii')
+                header.append(code + struct.pack('<B', len(encoded))
+                                + encoded)
+            self.writer.write(b''.join(header))
+
+        def stringIndex(self, text):
+            index = self.strings.get(text)
+            if index is None:
+                index = len(self.strings)
+                self.strings[text] = index
+                encoded = text.encode('utf-8')
+                self.writer.write(b'S' + struct.pack('<I', len(encoded))
+                                    + encoded)
+            return index
+
+        def writeDict(self, valueDict):
+            # names are checked in a fixed order, so output is the same
+            # for any order of input names
+            mask = 0
+            fields = []
+            extra = {}
+            bit = 1
+            for name, isString in zip(self.names, self.isString):
+                value = valueDict.get(name)
+                if value is None:
+                    fields.append(0)
+                    if name in valueDict:
+                        extra[name] = None      # keep explicit nulls
+                elif isString and isinstance(value, str):
+                    fields.append(self.stringIndex(value))
+                    mask |= bit
+                elif (not isString and type(value) is int
+                                    and -2**63 <= value < 2**63):
+                    fields.append(value)
+                    mask |= bit
+                else:
+                    fields.append(0)
+                    extra[name] = value     # unexpected type, keep as JSON
+                bit <<= 1
+            for name, value in valueDict.items():
+                if name not in self.nameSet:
+                    extra[name] = value
+            if extra:
+                encoded = json.dumps(extra).encode('utf-8')
+                fields.append(len(encoded))
+                mask |= self.extraBit
+            else:
+                encoded = b''
+                fields.append(0)
+            self.writer.write(self.record.pack(b'R', mask, *fields)
+                                + encoded)
+
+    class BinaryReader(object):
+        """
+        Iterate dictionaries from records written by BinaryWriter.
+
+        Names are in the order of the header, followed by other names in
+        the order they were written.
+        """
+        def __init__(self, reader):
+            self.reader = reader
+
+        def readExactly(self, size):
+            data = self.reader.read(size)
+            if len(data) != size:
+                raise ValueError('Binary input ends within a record')
+            return data
+
+        def readHeader(self, first=b''):
+            # first is any part of the magic number that was already read
+            magic = first + self.readExactly(len(JsonFormat.binaryMagic)
+                                                - len(first))
+            if magic != JsonFormat.binaryMagic:
+                raise ValueError('Input is not in binary format')
+            version, count = struct.unpack('<HH', self.readExactly(4))
+            if version != JsonFormat.binaryVersion:
+                raise ValueError('Unsupported binary format version '
+                                    + str(version))
+            names = []
+            codes = []
+            for n in range(count):
+                code, length = struct.unpack('<cB', self.readExactly(2))
+                if code not in (b'I', b'q'):
+                    raise ValueError('Unknown binary field type ' + str(code))
+                names.append(self.readExactly(length).decode('ascii'))
+                codes.append(code)
+            record = struct.Struct('<I' + b''.join(codes).decode('ascii')
+                                        + 'I')
+            # (bit, name, isString) for each field
+            fields = [(1 << n, name, code == b'I')
+                        for n, (name, code) in enumerate(zip(names, codes))]
+            return record, fields
+
+        @classmethod
+        def layout(cls, fields, mask):
+            """
+            Names present in records with a given bit mask.
+
+            Returns the names, a function to select their values from an
+            unpacked record, and the names that are string indexes.
+            """
+            names = []
+            indexes = []
+            stringNames = []
+            for n, (bit, name, isString) in enumerate(fields):
+                if mask & bit:
+                    names.append(name)
+                    indexes.append(n + 1)       # mask is at index 0
+                    if isString:
+                        stringNames.append(name)
+            if len(indexes) > 1:
+                getter = operator.itemgetter(*indexes)
+            else:
+                getter = lambda values: tuple(values[i] for i in indexes)
+            return tuple(names), getter, tuple(stringNames)
+
+        def __iter__(self):
+            extraBit = JsonFormat.BinaryWriter.extraBit
+            record, fields = self.readHeader()
+            strings = []
+            layouts = {}        # bit mask -> layout, few masks are in use
+            read = self.reader.read
+            unpack = record.unpack
+            size = record.size
+            while True:
+                tag = read(1)
+                if tag == b'R':
+                    data = read(size)
+                    if len(data) != size:
+                        raise ValueError('Binary input ends within a record')
+                    values = unpack(data)
+                    mask = values[0]
+                    layout = layouts.get(mask)
+                    if layout is None:
+                        layout = self.layout(fields, mask)
+                        layouts[mask] = layout
+                    names, getter, stringNames = layout
+                    value = dict(zip(names, getter(values)))  # ordered
+                    for name in stringNames:
+                        value[name] = strings[value[name]]
+                    if mask & extraBit:
+                        value.update(json.loads(
+                                self.readExactly(values[-1]).decode('utf-8')))
+                    yield value
+                elif tag == b'S':
+                    length, = struct.unpack('<I', self.readExactly(4))
+                    strings.append(self.readExactly(length).decode('utf-8'))
+                elif tag == JsonFormat.binaryMagic[:1]:
+                    # appended output, new header and string table
+                    record, fields = self.readHeader(tag)
+                    strings = []
+                    layouts = {}
+                    unpack = record.unpack
+                    size = record.size
+                elif tag == b'':
+                    return
+                else:
+                    raise ValueError('Unknown binary record type ' + str(tag))
+
 if __name__ == "__main__":
     cmdline = getopt.getopt(sys.argv[1:], 'h',
-                            longopts=['help', 'json', 'raw'])
+                            longopts=['help', 'json', 'raw', 'stats',
+                                      'binary', 'sweep'])
     argv = cmdline[1]
     opt = dict(cmdline[0])
 
@@ -190,10 +591,17 @@ if __name__ == "__main__":
         print(s, file=sys.stderr)
         sys.stderr.flush()
 
-    if len(argv) > 1 or '-h' in opt or '--help' in opt:
-        printerr("Usage: " + sys.argv[0] + " [-h|--help] [--raw] [filename]")
+    # --binary, --stats, and --sweep each choose a different kind of output
+    isExclusive = (sum(name in opt for name in ('--binary', '--stats',
+                                                '--sweep')) > 1
+                    or ('--binary' in opt and '--json' in opt))
+
+    if len(argv) > 1 or '-h' in opt or '--help' in opt or isExclusive:
+        printerr("Usage: " + sys.argv[0] + " [-h|--help] [--json] [--raw]"
+                 + " [--stats|--binary|--sweep] [filename]")
         printerr("       Convert simple JSON format to CSV format")
         printerr("       Input: JSON name-value pairs, one JSON per line")
+        printerr("              or binary records from client.py --binlog")
         printerr("       Output: CSV file with reordered JSON names as" +
                  " headings")
         printerr("               or JSON file with reordered JSON names")
@@ -203,6 +611,14 @@ if __name__ == "__main__":
         printerr("       -h|--help     print this message")
         printerr("       --json        output JSON instead of CSV")
         printerr("       --raw         do not format times")
+        printerr("       --binary      output binary records instead of CSV")
+        printerr("       --sweep       output one row for each point of" +
+                 " sweeps from client.py --sweep")
+        printerr("       --stats       input is speed summaries from the" +
+                 " server's /stats URL")
+        printerr("   Only one of --stats, --binary, and --sweep may be used")
+        printerr("   --json and --binary may not be used together")
+        printerr("   Input for --stats must be JSON")
         printerr("   Input times are interpreted as milliseconds from Unix" +
                  " epoch")
         printerr("   See script for details")
@@ -210,16 +626,38 @@ if __name__ == "__main__":
 
     isRaw = ('--raw' in opt)
     isJsonFormat = ('--json' in opt)
+    isStats = ('--stats' in opt)
+    isBinary = ('--binary' in opt)
+    isSweep = ('--sweep' in opt)
 
-    # Input text source
+    # Input source, binary records are recognized by their header
     if len(argv) > 0:
-        lineReader = open(argv[0], newline='')
+        byteReader = open(argv[0], 'rb')
     else:
-        lineReader = sys.stdin
+        byteReader = sys.stdin.buffer
+    isBinaryInput = JsonFormat.isBinaryInput(byteReader)
+    if isStats and isBinaryInput:
+        printerr("Input for --stats must be JSON, not binary records")
+        exit(1)
+    if not isBinaryInput:
+        lineReader = io.TextIOWrapper(byteReader, newline='')
+    writer = sys.stdout.buffer if isBinary else sys.stdout
 
     # Output columns of CSV data from the JSON input.
     try:
-        JsonFormat.copy(lineReader, sys.stdout, isRaw, isJsonFormat)
+        if isStats:
+            JsonFormat.copyStats(lineReader, writer, isRaw, isJsonFormat)
+        elif isSweep:
+            values = (JsonFormat.BinaryReader(byteReader) if isBinaryInput
+                        else JsonFormat.readJson(lineReader))
+            JsonFormat.copySweep(values, writer, isRaw, isJsonFormat)
+        elif isBinaryInput:
+            JsonFormat.copyBinary(byteReader, writer, isRaw, isJsonFormat,
+                                                      isBinary)
+        else:
+            JsonFormat.copy(lineReader, writer, isRaw, isJsonFormat,
+                                                isBinary)
+        writer.flush()
     finally:
-        if not lineReader is sys.stdin:
-            lineReader.close()
+        if not byteReader is sys.stdin.buffer:
+            byteReader.close()
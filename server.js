@@ -10,6 +10,11 @@
 /*
   The client maintains state between requests, but the server does not.
 
+  Optionally (command line option '--stats') the server keeps a small,
+  bounded summary of recent speeds for each client, which is available as
+  JSON from the '/stats' URL to requests from the server's own host.  The summary is not needed to run tests and is
+  lost when the server stops.  See class SpeedStats for details.
+
   Memory requirements are almost independed of upload and download sizes.
   Download data is provided from a stream.Reader that produces any amount of
   data.  Upload data is discarded, except for a small amount sufficient to hold
@@ -75,6 +80,14 @@ const downreportPath = '/downreport'
 const uploadPath = '/upload'
 const upreportPath = '/upreport'
 const pingPath = '/echo';
+const statsPath = '/stats';
+
+// optional in-memory summary of recent speeds, see class SpeedStats
+const statsEnabled = process.argv.includes('--stats');
+const statsWindowLength = 100;          // max speeds kept per client
+const statsWindowTime = 3_600_000;      // max age of kept speeds, ms
+const statsMaxClients = 10_000;         // least recently seen are dropped
+const statsPercentiles = [10, 50, 90];
 
 // running server will look for some resources arter script has completed
 const scriptpath = module.filename ? module.filename : null;
@@ -96,17 +109,19 @@ logStream.on('error', (err) => {
 });
 
 // data block for large downloads of meaningless data
+// Buffers are filled once and shared by all downloads.  They are never
+// modified after they are filled, so the same memory can be pushed to any
+// number of streams without copying or re-encoding.
 const tx = '012345678901234567890123456789012345678901234567890123456789012\n';
-function makeDatablock()  {
-  var block = [];
-  var n = 256;
-  while (n > 0) {
-    n -= 1;
-    block.push(tx);
+const datablocks = new Map();   // Buffer for each highWaterMark in use
+function getDatablock(length)  {
+  var block = datablocks.get(length);
+  if (! block)  {
+    block = Buffer.alloc(length, tx, 'latin1');   // tx repeated to fill
+    datablocks.set(length, block);
   }
-  return block.join('');
+  return block;
 }
-const datablock = makeDatablock();  // 16,384 bytes
 
 // Readable to produce specified amount of meaningless data for large downloads
 //    https://nodejs.org/api/stream.html#stream_implementing_a_readable_stream
@@ -115,26 +130,215 @@ class DataStream extends stream.Readable  {
   constructor(size) {   // size of download to send
     super();
     this.n = size;
-    this.chunk = datablock;
+    // one block fills the internal buffer of the stream
+    this.chunk = getDatablock(Math.max(1, this.readableHighWaterMark));
     this.chunkLength = this.chunk.length;
   }
 
   // function used to request that more data be placed in buffer
   // data is "pushed" into a buffer to make it available from the reader
+  // pushed chunks are views of the shared block, not copies
   _read(size) {
     // chunk length > 0, <= unused buffer space, <= available data chunk
     var len = Math.max(1, Math.min(size, this.chunkLength));
+    var chunk = (len == this.chunkLength) ? this.chunk
+                                          : this.chunk.subarray(0, len);
     while (this.n > len)  {
       this.n -= len;
-      if (!this.push(this.chunk))  {
+      if (!this.push(chunk))  {
         return;         // buffer temporarily full
       }
     }
-    this.push(this.chunk.slice(0, this.n));  // last block, may be zero length
+    this.push(this.chunk.subarray(0, this.n));  // last block, may be empty
     this.push(null);  // no more data available
   }
 };
 
+// Select the k-th smallest (0-based) number of an array, reorders the array
+// Hoare's selection, average time is linear in the length of the array.
+function selectKth(values, k)  {
+  var lo = 0;
+  var hi = values.length - 1;
+  while (lo < hi)  {
+    var pivot = values[(lo + hi) >> 1];
+    var i = lo;
+    var j = hi;
+    while (i <= j)  {
+      while (values[i] < pivot) i++;
+      while (values[j] > pivot) j--;
+      if (i <= j)  {
+        var t = values[i];
+        values[i] = values[j];
+        values[j] = t;
+        i++;
+        j--;
+      }
+    }
+    if (k <= j)  {
+      hi = j;
+    } else if (k >= i)  {
+      lo = i;
+    } else {
+      break;            // values[k] is between the partitions
+    }
+  }
+  return values[k];
+}
+
+// Summary of an array of speeds: count, min, max, and nearest-rank
+// percentiles, with names prefixed by 'prefix'.  Reorders the array.
+function summarize(prefix, values)  {
+  var summary = {};
+  var n = values.length;
+  summary[prefix + 'Count'] = n;
+  if (n < 1)  {
+    return summary;
+  }
+  var min = values[0];
+  var max = values[0];
+  for (var v of values)  {
+    min = Math.min(min, v);
+    max = Math.max(max, v);
+  }
+  summary[prefix + 'Min'] = min;
+  for (var p of statsPercentiles)  {
+    var k = Math.max(0, Math.ceil(p * n / 100) - 1);
+    summary[prefix + 'P' + p] = selectKth(values, k);
+  }
+  summary[prefix + 'Max'] = max;
+  return summary;
+}
+
+// Rolling window of the most recent speeds, oldest speeds are overwritten
+class SpeedWindow  {
+  constructor(length) {
+    this.times = new Array(length);
+    this.speeds = new Array(length);
+    this.next = 0;      // index of next entry to write
+    this.count = 0;     // number of valid entries
+  }
+
+  add(time, speed)  {
+    this.times[this.next] = time;
+    this.speeds[this.next] = speed;
+    this.next = (this.next + 1) % this.speeds.length;
+    this.count = Math.min(this.count + 1, this.speeds.length);
+  }
+
+  // append speeds no older than 'since' to array 'values'
+  collect(since, values)  {
+    for (var i = 0; i < this.count; i++)  {
+      if (this.times[i] >= since)  {
+        values.push(this.speeds[i]);
+      }
+    }
+    return values;
+  }
+};
+
+// Bounded summary of recent download and upload speeds for each client.
+//
+// Speeds come from download and upload reports, which carry the client's
+// own measurements.  Each client (external IP and test ID) has a fixed-size
+// window of speeds for each direction.  Clients are kept in a Map in order
+// of last report, and the least recently seen client is dropped when there
+// are too many, so memory use has a fixed upper bound.
+class SpeedStats  {
+  constructor(windowLength, windowTime, maxClients) {
+    this.windowLength = windowLength;
+    this.windowTime = windowTime;
+    this.maxClients = maxClients;
+    this.clients = new Map();
+  }
+
+  // megabits per second from a report, or null if it can not be calculated
+  static speed(info)  {
+    var bytes;
+    var ms;
+    if (info.pathname == downreportPath)  {
+      bytes = info.downloadReceiveLength;
+      ms = info.clientResponseEnd - info.clientResponseBegin;
+    } else if (info.pathname == upreportPath)  {
+      bytes = info.uploadReceiveLength;
+      ms = info.clientResponseEnd - info.clientRequestBegin;
+    } else {
+      return null;
+    }
+    if (! (bytes > 0 && ms > 0))  {
+      return null;      // missing, invalid, or too quick to measure
+    }
+    return 8 * bytes / ms / 1000;
+  }
+
+  // add the speed from a download or upload report
+  record(info)  {
+    var speed = SpeedStats.speed(info);
+    if (info.error || speed === null)  {
+      return;
+    }
+    var key = info.externalIP + ' ' + info.testID;
+    var client = this.clients.get(key);
+    if (client)  {
+      this.clients.delete(key);     // re-insert as most recently seen
+    } else {
+      client = {
+        externalIP:   info.externalIP,
+        testID:       info.testID,
+        download:     new SpeedWindow(this.windowLength),
+        upload:       new SpeedWindow(this.windowLength),
+      };
+      if (this.clients.size >= this.maxClients)  {
+        // Map keys are in insertion order, first is least recently seen
+        this.clients.delete(this.clients.keys().next().value);
+      }
+    }
+    client.lastTimestamp = info.serverTimestamp;
+    var direction = (info.pathname == downreportPath) ? 'download' : 'upload';
+    client[direction].add(info.serverTimestamp, speed);
+    this.clients.set(key, client);
+  }
+
+  // per-client and global summaries of speeds within the time window
+  report(now)  {
+    var since = now - this.windowTime;
+    var allDownloads = [];
+    var allUploads = [];
+    var clients = [];
+    for (var client of this.clients.values())  {
+      if (client.lastTimestamp < since)  {
+        continue;       // nothing recent
+      }
+      var downloads = client.download.collect(since, []);
+      var uploads = client.upload.collect(since, []);
+      allDownloads.push(...downloads);
+      allUploads.push(...uploads);
+      clients.push(Object.assign(
+        { scope:          'client',
+          externalIP:     client.externalIP,
+          testID:         client.testID,
+          lastTimestamp:  client.lastTimestamp,
+        },
+        summarize('download', downloads),
+        summarize('upload', uploads)));
+    }
+    var global = Object.assign(
+      { scope:  'global' },
+      summarize('download', allDownloads),
+      summarize('upload', allUploads));
+    return {
+      serverTimestamp:  now,
+      windowTime:       this.windowTime,
+      global:           global,
+      clients:          clients,
+    };
+  }
+};
+
+const speedStats = (statsEnabled ? new SpeedStats(statsWindowLength,
+                                                  statsWindowTime,
+                                                  statsMaxClients)
+                                 : null);
+
 // I'm alive!
 function showRequest(req, res, info)  {
   res.write('method=' + req.method + '\n');
@@ -232,6 +436,9 @@ function reply_download(req, res, info)  {
 
 // reply to a download report from a client
 function reply_downreport(req, res, info)  {
+  if (speedStats)  {
+    speedStats.record(info);
+  }
   res.setHeader('Content-Type', 'application/json');
   res.write(JSON.stringify(info));
   res.end();
@@ -247,11 +454,34 @@ function reply_upload (req, res, info)  {
 
 // reply to a upload report from a client
 function reply_upreport(req, res, info)  {
+  if (speedStats)  {
+    speedStats.record(info);
+  }
   res.setHeader('Content-Type', 'application/json');
   res.write(JSON.stringify(info));
   res.end();
 };
 
+// whether a client address is on this host (IPv4, IPv6, or mapped IPv4)
+function isLoopback(address)  {
+  return (typeof address === 'string'
+          && (address.startsWith('127.') || address == '::1'
+              || address.startsWith('::ffff:127.')));
+}
+
+// reply to a request for a summary of recent speeds
+// the summary shows every recent client, so it is only sent to this host
+function reply_stats(req, res, info)  {
+  if (! isLoopback(req.socket.remoteAddress))  {
+    info.error = '404 Stats only available from loopback address';
+    return reply_404(req, res, info);
+  }
+  res.setHeader('Content-Type', 'application/json');
+  // one line per reply, so replies can be appended to a file
+  res.write(JSON.stringify(speedStats.report(info.serverTimestamp)) + '\n');
+  res.end();
+};
+
 // make a specified reply to a POST request from a client
 function reply_POST(reply_function, req, res, info)  {
   if (req.method == 'POST')  {   // content is in body
@@ -363,6 +593,9 @@ const server = http.createServer((req, res) => {
     else if (pathname == upreportPath)  {
       reply_POST(reply_upreport, req, res, info);
     }
+    else if (pathname == statsPath && speedStats)  {
+      reply_stats(req, res, info);
+    }
     else {
       info.error = '404 Page Not Found';
       reply_404(req, res, info);
@@ -411,7 +644,8 @@ server.listen(port, hostname, () => {
     serverTimestamp : Date.now(),
     hostname : hostname,
     port : port,
-    scriptpath : scriptpath
+    scriptpath : scriptpath,
+    stats : statsEnabled
   }) + '\n');
   logStream.write(message);
   console.error(message);